@@ -3,9 +3,27 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import traceback
+import csv
+import hashlib
+import json
+import math
+import os
+import tempfile
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 from io import StringIO
-from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from fast_kernels import combine_date_hour, hourly_mean, hourly_profile, summary_stats
 
 # --- Page Configuration ---
 st.set_page_config(page_title="ERCOT Price Viewer", layout="wide")
@@ -24,6 +42,8 @@ if 'location_input' not in st.session_state:
     st.session_state.location_input = ""
 if 'show_analysis' not in st.session_state:
     st.session_state.show_analysis = False
+if 'stats' not in st.session_state:
+    st.session_state.stats = None
 
 REPORT_CONFIG = {
     "DAM - LMPs (by Bus)": {
@@ -53,6 +73,43 @@ REPORT_CONFIG = {
     }
 }
 
+# Concurrent page requests when a query spans more than one page of results;
+# throttled (429) pages are retried by the session in get_http_session
+MAX_PAGE_WORKERS = 4
+
+# ERCOT operating days follow Central time, whatever timezone the app host runs in
+ERCOT_TIMEZONE = ZoneInfo("America/Chicago")
+
+# Normalized API responses are persisted here so every Streamlit process shares them
+CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache"
+
+# Hour Ending 7 is hour 6 (6:00-6:59). Hour Ending 18 is hour 17 (17:00-17:59).
+SOLAR_HOUR_START, SOLAR_HOUR_END = 6, 18 # This is hours 6 through 17
+
+def compute_period_stats(df, price_column):
+    """
+    Computes the filtered data, summary statistics and hourly averages for every
+    analysis period in one go, so switching periods doesn't recompute anything.
+    """
+    # Hour of day straight from the datetime64 buffer: whole hours since the epoch, mod 24
+    hour_arr = df['datetime'].to_numpy().astype('datetime64[h]').view('i8') % 24
+    period_masks = {
+        "Full Day (24 hours)": slice(None),
+        "Solar Hours (HE 7-18)": (hour_arr >= SOLAR_HOUR_START) & (hour_arr < SOLAR_HOUR_END),
+    }
+
+    period_stats = {}
+    for period, mask in period_masks.items():
+        df_period = df.iloc[mask]
+        prices = df_period[price_column].to_numpy(dtype=np.float64, na_value=np.nan)
+        hours, hourly_means = hourly_profile(hour_arr[mask], prices)
+        period_stats[period] = {
+            "data": df_period,
+            "summary": summary_stats(prices),
+            "hourly": pd.DataFrame({'hour': hours, price_column: hourly_means}),
+        }
+    return period_stats
+
 def display_statistical_analysis(df, price_column):
     """
     Calculates and displays advanced statistical analysis of the price data,
@@ -68,28 +125,26 @@ def display_statistical_analysis(df, price_column):
         horizontal=True
     )
     
-    # --- NEW: Filter the dataframe based on the selection ---
-    df_filtered = df.copy() # Work with a copy to avoid modifying the original
-    period_label = "(Full Day)"
-    
-    if analysis_period == "Solar Hours (HE 7-18)":
-        # Hour Ending 7 is hour 6 (6:00-6:59). Hour Ending 18 is hour 17 (17:00-17:59).
-        solar_hours = range(6, 18) # This is hours 6 through 17
-        df_filtered = df_filtered[df_filtered['datetime'].dt.hour.isin(solar_hours)]
-        period_label = "(Solar Hours)"
+    # --- Stats for both periods are computed once per fetch and reused on every toggle ---
+    if st.session_state.stats is None:
+        st.session_state.stats = compute_period_stats(df, price_column)
+    period_stats = st.session_state.stats[analysis_period]
+    df_filtered = period_stats["data"]
+    period_label = "(Solar Hours)" if analysis_period == "Solar Hours (HE 7-18)" else "(Full Day)"
 
     # --- NEW: Check if there's any data left after filtering ---
-    if df_filtered.empty:
+    if not len(df_filtered):
         st.warning(f"No data available for the selected period: {analysis_period}")
         return # Stop the function if no data
         
     # --- Key Metrics (now using the filtered dataframe) ---
+    mean_price, median_price, max_price, min_price = period_stats["summary"]
     st.markdown(f"#### Summary Statistics {period_label}")
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Mean Price", f"${df_filtered[price_column].mean():.2f}")
-    col2.metric("Median Price", f"${df_filtered[price_column].median():.2f}")
-    col3.metric("Highest Price", f"${df_filtered[price_column].max():.2f}")
-    col4.metric("Lowest Price", f"${df_filtered[price_column].min():.2f}")
+    col1.metric("Mean Price", f"${mean_price:.2f}")
+    col2.metric("Median Price", f"${median_price:.2f}")
+    col3.metric("Highest Price", f"${max_price:.2f}")
+    col4.metric("Lowest Price", f"${min_price:.2f}")
     
     st.write("---")
     st.markdown(f"#### Price Distribution {period_label}")
@@ -108,12 +163,8 @@ def display_statistical_analysis(df, price_column):
     st.write("---")
     st.markdown(f"#### Average Price by Hour of Day {period_label}")
     
-    # This part still works correctly because df_filtered will only contain the relevant hours
-    df_filtered['hour'] = df_filtered['datetime'].dt.hour
-    hourly_avg = df_filtered.groupby('hour')[price_column].mean().reset_index()
-    
     fig_hourly = px.bar(
-        hourly_avg,
+        period_stats["hourly"],
         x='hour',
         y=price_column,
         title=f"Average Price by Hour {period_label} for {st.session_state.location_input}",
@@ -123,6 +174,25 @@ def display_statistical_analysis(df, price_column):
 
 # --- ERCOT API Communication ---
 
+@st.cache_resource
+def get_http_session():
+    """
+    Returns a process-wide requests.Session so the token and data calls reuse
+    pooled keep-alive connections instead of a new TCP+TLS handshake each time.
+    """
+    session = requests.Session()
+    # Concurrent page fetches can trip ERCOT's per-key rate limit, so back off and retry
+    # throttled or transient failures; allowed_methods=None also covers the token POST
+    retries = Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=(429, 502, 503, 504),
+        respect_retry_after_header=True,
+        allowed_methods=None,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(8, MAX_PAGE_WORKERS), max_retries=retries))
+    return session
+
 def get_ercot_token(username, password):
     """
     Get an access token from the ERCOT API using the ROPC flow.
@@ -139,7 +209,7 @@ def get_ercot_token(username, password):
     )
 
     try:
-        auth_response = requests.post(auth_url)
+        auth_response = get_http_session().post(auth_url)
         auth_response.raise_for_status()  # Will raise an exception for HTTP error codes
         access_token = auth_response.json().get("access_token")
         if access_token:
@@ -157,6 +227,74 @@ def get_ercot_token(username, password):
             st.json(e.response.json())
         return None
 
+# Arrow types for the 'dataType' values ERCOT reports in a response's 'fields'
+ERCOT_ARROW_TYPES = {
+    "VARCHAR": pa.string(),
+    "FLOAT": pa.float64(),
+    "DOUBLE": pa.float64(),
+    "DOUBLE PRECISION": pa.float64(),
+    "NUMERIC": pa.float64(),
+    "INTEGER": pa.int64(),
+    "BIGINT": pa.int64(),
+    "BOOLEAN": pa.bool_(),
+    "DATE": pa.date32(),
+    "TIMESTAMP": pa.timestamp("ms"),
+}
+
+def records_to_dataframe(records, fields):
+    """
+    Builds a typed DataFrame from ERCOT's row-oriented 'data' records, using the
+    'fields' schema so numeric and date columns arrive already parsed.
+    """
+    columns = zip(*records)
+    arrays = []
+    for field, values in zip(fields, columns):
+        arrow_type = ERCOT_ARROW_TYPES.get(str(field.get("dataType", "")).upper())
+        try:
+            array = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed-type column; keep its text and let normalization coerce it
+            array = pa.array([None if v is None else str(v) for v in values])
+        if arrow_type is not None and array.type != arrow_type:
+            try:
+                array = array.cast(arrow_type)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass # Leave the column as received; normalization will coerce it
+        arrays.append(array)
+
+    table = pa.Table.from_arrays(arrays, names=[f["name"] for f in fields])
+    return table.to_pandas(date_as_object=False, self_destruct=True, split_blocks=True)
+
+# --- Datetime Builders (one per ERCOT timestamp layout) ---
+
+def _datetime_from_sced_timestamp(df):
+    """Case 1: Real-time data with a full timestamp column."""
+    # ERCOT sends ISO 8601 stamps; naming the format skips dateutil's per-row inference,
+    # and cache=True parses each of the many repeated SCED stamps only once
+    return pd.to_datetime(df['SCEDTimestamp'], format='ISO8601', cache=True, errors='coerce')
+
+def _datetime_from_hour_ending(df):
+    """Case 2: DAM data with separate date and hour ending (e.g., '04:00')."""
+    # 'HH:MM' -> HH in a single pass over the Arrow string buffer
+    hours = df['hourEnding'].astype('string[pyarrow]').str.slice(0, 2).str.rstrip(':').astype('int8').to_numpy()
+    return combine_date_hour(pd.to_datetime(df['deliveryDate'], errors='coerce').to_numpy(), hours)
+
+def _datetime_from_delivery_hour(df):
+    """Case 3: RTM data with separate date and delivery hour (e.g., 4)."""
+    # Missing or malformed hours become NaN, then NaT, so the dropna below removes those rows
+    hours = pd.to_numeric(df['deliveryHour'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return combine_date_hour(pd.to_datetime(df['deliveryDate'], errors='coerce').to_numpy(), hours)
+
+# Checked in order; the first layout whose columns are all present builds 'datetime'
+DATETIME_BUILDERS = (
+    (frozenset({'SCEDTimestamp'}), _datetime_from_sced_timestamp,
+     "Detected 'SCEDTimestamp' column for real-time data."),
+    (frozenset({'deliveryDate', 'hourEnding'}), _datetime_from_hour_ending,
+     "Detected 'deliveryDate' and 'hourEnding' columns."),
+    (frozenset({'deliveryDate', 'deliveryHour'}), _datetime_from_delivery_hour,
+     "Detected 'deliveryDate' and 'deliveryHour' columns."),
+)
+
 def process_and_normalize_data(df, price_column_name):
     """
     NEW: A flexible function that inspects the DataFrame and creates a standardized 'datetime' column.
@@ -166,36 +304,34 @@ def process_and_normalize_data(df, price_column_name):
         return pd.DataFrame()
 
     try:
-        # Case 1: Real-time data with a full timestamp column
-        if 'SCEDTimestamp' in df.columns:
-            st.info("Detected 'SCEDTimestamp' column for real-time data.")
-            df['datetime'] = pd.to_datetime(df['SCEDTimestamp'], errors='coerce')
-        
-        # Case 2: DAM data with separate date and hour ending (e.g., '04:00')
-        elif 'deliveryDate' in df.columns and 'hourEnding' in df.columns:
-            st.info("Detected 'deliveryDate' and 'hourEnding' columns.")
-            df['hour'] = df['hourEnding'].astype(str).str.split(':').str[0].astype(int)
-            df['datetime'] = pd.to_datetime(df['deliveryDate'], errors='coerce') + pd.to_timedelta(df['hour'] - 1, unit='h')
-        
-        # Case 3: RTM data with separate date and delivery hour (e.g., 4)
-        elif 'deliveryDate' in df.columns and 'deliveryHour' in df.columns:
-            st.info("Detected 'deliveryDate' and 'deliveryHour' columns.")
-            df['hour'] = df['deliveryHour'].astype(int)
-            df['datetime'] = pd.to_datetime(df['deliveryDate'], errors='coerce') + pd.to_timedelta(df['hour'] - 1, unit='h')
-            
-        else:
+        columns = frozenset(df.columns)
+        match = next(((builder, message) for required, builder, message in DATETIME_BUILDERS if required <= columns), None)
+        if match is None:
             st.error("Could not find a recognizable timestamp column ('SCEDTimestamp') or date/hour combination.")
             st.write("Available columns:", df.columns.tolist())
             return pd.DataFrame()
 
+        builder, message = match
+        st.info(message)
+        df['datetime'] = builder(df)
+
         # Standard processing for all cases
-        df[price_column_name] = pd.to_numeric(df[price_column_name], errors='coerce')
+        # Prices typed by the Arrow ingest are already numeric; only coerce text columns
+        if df[price_column_name].dtype.kind not in 'fi':
+            df[price_column_name] = pd.to_numeric(df[price_column_name], errors='coerce')
         df.dropna(subset=['datetime', price_column_name], inplace=True)
-        df.sort_values(by='datetime', inplace=True)
+        # DAM reports already arrive in delivery order; only pay for a sort when they don't
+        if not df['datetime'].is_monotonic_increasing:
+            df.sort_values(by='datetime', inplace=True, kind='stable')
         
+        # Prices are only ever shown to the cent, so float32 is plenty and halves every later scan
+        df[price_column_name] = df[price_column_name].astype(np.float32)
+
         # Keep only the essential columns for the final output
         essential_columns = ['datetime', price_column_name] + [col for col in ['settlementPoint', 'busName', 'electricalBus'] if col in df.columns]
-        return df[essential_columns]
+        # Arrow-backed columns keep the session-state frame compact across reruns;
+        # convert_integer=False stops whole-dollar prices from being inferred as ints
+        return df[essential_columns].convert_dtypes(dtype_backend='pyarrow', convert_integer=False)
 
     except Exception as e:
         st.error(f"Failed during data normalization. Error: {e}")
@@ -210,41 +346,141 @@ def resample_to_hourly_average(df, price_column_name):
     if df.empty or 'datetime' not in df.columns:
         return pd.DataFrame()
     
-    # Set 'datetime' as the index to perform time-series resampling
-    df_resampled = df.set_index('datetime')
-    
-    # Resample to hourly ('H') frequency and calculate the mean
-    df_resampled = df_resampled[price_column_name].resample('H').mean().reset_index()
-    
-    return df_resampled
+    # Bucket the raw int64 timestamps by hour instead of building a DatetimeIndex grouper
+    ts_ns = df['datetime'].to_numpy().astype('datetime64[ns]').view('i8')
+    prices = df[price_column_name].to_numpy(dtype=np.float64, na_value=np.nan)
+    bucket_ts, means = hourly_mean(ts_ns, prices)
+
+    # Inputs are already float32, so round off their noise before narrowing again; a mean
+    # of four cent-valued quarter-hour prices never needs more than four decimals
+    means = np.round(means, 4).astype(np.float32)
+    df_resampled = pd.DataFrame({'datetime': bucket_ts.view('datetime64[ns]'), price_column_name: means})
+    return df_resampled.convert_dtypes(dtype_backend='pyarrow', convert_integer=False)
+
+def dataframe_to_csv_bytes(df):
+    """
+    Serializes a DataFrame to UTF-8 CSV bytes with pyarrow's multithreaded writer,
+    without building an intermediate Python string.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Write whole-second timestamps rather than Arrow's default fractional-second format
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type):
+            table = table.set_column(i, field.name, pc.cast(table[i], pa.timestamp('s'), safe=False))
+
+    # Match pandas' minimal quoting: Arrow quotes the header and every string under both its
+    # 'needed' and 'none' styles, so write the header here and the rows unquoted where possible
+    header = StringIO()
+    csv.writer(header, lineterminator="\n").writerow(table.column_names)
+
+    sink = pa.BufferOutputStream()
+    sink.write(header.getvalue().encode("utf-8"))
+    try:
+        pa_csv.write_csv(table, sink, pa_csv.WriteOptions(include_header=False, quoting_style="none"))
+    except pa.ArrowInvalid:
+        # A value contains a delimiter, quote or newline; fall back to quoting the string columns
+        sink = pa.BufferOutputStream()
+        sink.write(header.getvalue().encode("utf-8"))
+        pa_csv.write_csv(table, sink, pa_csv.WriteOptions(include_header=False, quoting_style="needed"))
+    return sink.getvalue().to_pybytes()
+
+# --- Disk Cache ---
+
+def _cache_path(url, params):
+    """
+    Returns the Parquet file path a normalized response for (url, params) is cached under.
+    """
+    cache_key = hashlib.blake2b(json.dumps(params, sort_keys=True).encode() + url.encode(), digest_size=16).hexdigest()
+    return CACHE_DIR / f"{cache_key}.parquet"
+
+def _read_cache(path):
+    """Loads a cached DataFrame, or returns None if there is no usable cache file."""
+    if not path.exists():
+        return None
+    try:
+        return pq.read_table(path).to_pandas(types_mapper=pd.ArrowDtype)
+    except Exception:
+        # A corrupt or partially written file is treated as a cache miss
+        return None
+
+def _write_cache(path, df):
+    """Writes a DataFrame to the cache, replacing the file atomically."""
+    tmp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Sessions are threads in one process, so the temp name must be unique per write
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+    except Exception as e:
+        st.warning(f"Could not write data to the local cache: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def fetch_remaining_pages(url, headers, params, total_pages):
+    """
+    Fetches pages 2..total_pages of a paged ERCOT query concurrently and
+    returns their data records in page order.
+    """
+    session = get_http_session()
+
+    def get_page(page):
+        response = session.get(url, headers=headers, params={**params, "page": page})
+        response.raise_for_status()
+        return orjson.loads(response.content).get("data", [])
+
+    with ThreadPoolExecutor(max_workers=MAX_PAGE_WORKERS) as executor:
+        pages = executor.map(get_page, range(2, total_pages + 1))
+        return [record for page_records in pages for record in page_records]
+
+def fetch_api_data(url, headers, params, price_column, access_token, subscription_key, use_cache=True):
+    """
+    A generic function to fetch and process data from an ERCOT endpoint.
+    Results are cached to disk as Parquet, keyed by url and params; set use_cache=False
+    for ranges that ERCOT may still be publishing.
+    """
+    cache_path = _cache_path(url, params)
+    if use_cache:
+        cached = _read_cache(cache_path)
+        if cached is not None:
+            return cached
 
-@st.cache_data   
-def fetch_api_data(url, headers, params, price_column, access_token, subscription_key):
-    """A generic function to fetch and process data from an ERCOT endpoint."""
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Ocp-Apim-Subscription-Key": subscription_key
     }
 
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = get_http_session().get(url, headers=headers, params=params)
         response.raise_for_status()
-        data = response.json()
+        # orjson parses the raw body several times faster than the stdlib json behind response.json()
+        data = orjson.loads(response.content)
         
-        total_records = data.get("_meta", {}).get("totalRecords", 0)
+        meta = data.get("_meta", {})
+        total_records = meta.get("totalRecords", 0)
         if total_records == 0:
             st.warning("API reported 0 total records for the given parameters.")
             return pd.DataFrame()
 
-        column_names = [f["name"] for f in data.get("fields", []) if "name" in f]
+        fields = [f for f in data.get("fields", []) if "name" in f]
         records = data.get("data", [])
 
-        if not column_names or not records:
+        if not fields or not records:
             st.error("API response was missing column names ('fields') or data records ('data').")
             return pd.DataFrame()
 
-        df = pd.DataFrame(records, columns=column_names)
-        return process_and_normalize_data(df, price_column)
+        # Results beyond the first page used to be silently dropped
+        total_pages = meta.get("totalPages") or math.ceil(total_records / len(records))
+        if total_pages > 1:
+            st.info(f"Fetching {total_pages - 1} more page(s) of results...")
+            records = records + fetch_remaining_pages(url, headers, params, total_pages)
+
+        df = records_to_dataframe(records, fields)
+        df = process_and_normalize_data(df, price_column)
+        if use_cache and not df.empty:
+            _write_cache(cache_path, df)
+        return df
 
     except requests.exceptions.RequestException as e:
         st.error(f"API Request failed: {e}")
@@ -312,18 +548,24 @@ if st.sidebar.button("Fetch Data"):
             "size": 5000
         }
             
-        df = fetch_api_data(config["url"], headers, params, config["price_column"], st.session_state.ercot_access_token, ERCOT_SUBSCRIPTION_KEY)
+        # Only cache ranges that have fully settled. ERCOT is still publishing today's data
+        # (Central time), and late RTM intervals for yesterday can post after midnight
+        ercot_today = datetime.now(ERCOT_TIMEZONE).date()
+        use_cache = end_date < ercot_today - timedelta(days=1)
+        df = fetch_api_data(config["url"], headers, params, config["price_column"], st.session_state.ercot_access_token, ERCOT_SUBSCRIPTION_KEY, use_cache=use_cache)
         if not df.empty and config.get("resample", False):
             df = resample_to_hourly_average(df, config["price_column"])
 
         st.session_state.data = df
+        st.session_state.stats = None
         st.session_state.price_column = config["price_column"]
         st.session_state.report_type = report_type
         st.session_state.location_input = location_input
 
 # --- Display Data ---
-if not st.session_state.data.empty:
-    df = st.session_state.data
+# Bind the session-state frame once; len() is a constant-time row count
+df = st.session_state.data
+if df is not None and len(df):
     price_column = st.session_state.price_column
     report_type = st.session_state.report_type
     location_input = st.session_state.location_input
@@ -340,7 +582,7 @@ if not st.session_state.data.empty:
         fig = px.line(df, x="datetime", y=price_column, title=graph_title)
         st.plotly_chart(fig, use_container_width=True)
 
-        csv = df.to_csv(index=False).encode("utf-8")
+        csv = dataframe_to_csv_bytes(df)
         st.download_button(
             label="Download data as CSV",
             data=csv,
@@ -351,5 +593,5 @@ if not st.session_state.data.empty:
     with tab2:
         display_statistical_analysis(df, price_column)
 
-elif st.session_state.data is None:
+elif df is None:
     st.warning("No data found or processed for the given parameters.")
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+NumPy kernels for the price series behind the ERCOT Price Viewer.
+
+Each function works on plain NumPy arrays pulled out of the normalized
+DataFrame, so the hot paths run as a handful of vectorized C passes.
+"""
+import numpy as np
+
+NS_PER_HOUR = 3_600_000_000_000
+
+def combine_date_hour(dates, hours_ending):
+    """
+    Combines datetime64 delivery dates with hour-ending values (1-24) into the
+    datetime64 start of each hour. NaT dates and NaN hours both give NaT.
+    """
+    hours_ending = np.asarray(hours_ending, dtype=np.float64)
+    missing = np.isnan(hours_ending)
+    offsets = (np.where(missing, 1, hours_ending).astype(np.int64) - 1).astype('timedelta64[h]')
+    combined = dates + offsets
+    combined[missing] = np.datetime64('NaT')
+    return combined
+
+def hourly_mean(ts_ns, vals):
+    """
+    Averages values into whole-hour buckets given int64 nanosecond timestamps.
+    Returns the bucket start times (ns) and their means; hours with no data are NaN,
+    matching pandas' resample('H').mean().
+    """
+    buckets = ts_ns // NS_PER_HOUR
+    first_bucket = buckets.min()
+    offsets = buckets - first_bucket
+    n_buckets = int(offsets.max()) + 1
+    sums = np.bincount(offsets, weights=vals, minlength=n_buckets)
+    counts = np.bincount(offsets, minlength=n_buckets)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    bucket_ts = (first_bucket + np.arange(n_buckets)) * NS_PER_HOUR
+    return bucket_ts, means
+
+def summary_stats(prices):
+    """
+    Returns (mean, median, max, min) of a float64 price array, ignoring NaNs.
+    The median comes from an O(n) np.partition rather than a full sort.
+    """
+    prices = prices[~np.isnan(prices)]
+    n = len(prices)
+    if n == 0:
+        return (np.nan,) * 4
+
+    mid = n // 2
+    kth = [mid - 1, mid] if n % 2 == 0 else [mid]
+    median = np.partition(prices, kth)[kth].mean()
+    return prices.mean(), median, prices.max(), prices.min()
+
+def hourly_profile(hours, prices):
+    """
+    Averages prices by hour of day (0-23) with np.bincount, ignoring NaNs.
+    Returns the hours that have data and their mean prices.
+    """
+    valid = ~np.isnan(prices)
+    hours, prices = hours[valid], prices[valid]
+    sums = np.bincount(hours, weights=prices, minlength=24)
+    counts = np.bincount(hours, minlength=24)
+    observed = counts > 0
+    return np.arange(24)[observed], sums[observed] / counts[observed]